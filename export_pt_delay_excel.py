@@ -10,14 +10,18 @@ Inputs:
 
 Notes:
 - We infer values from files found under simdir (stop_events_<value>_<sim>.xml)
-- Requires: pandas, openpyxl
+- Requires: pandas, xlsxwriter
 """
 
 import argparse
+import functools
+import gc
 import os
 import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List
+import numpy as np
 import pandas as pd
 
 # Prefer lxml (with recover) when available
@@ -30,34 +34,98 @@ except Exception:  # pragma: no cover
 
 STOP_MIXED_RE = re.compile(r"stop_events_(\d+)_(\d+)\.xml$")
 
+SHEET_COLUMNS = (
+    "value",
+    "sim",
+    "stop",
+    "occurrence",
+    "delay_baseline_s",
+    "delay_mixed_s",
+    "delay_delta_s",
+)
 
-def _parse_root(path: str):
+
+def _iter_elements(path: str, tag: str):
+    """Stream elements with the given tag, freeing each one after use.
+
+    Avoids building the full DOM: peak memory stays O(1) in the file size.
+    """
     if _HAS_LXML:
-        parser = ET.XMLParser(recover=True)
-        return ET.parse(path, parser=parser).getroot()
-    else:
-        return ET.parse(path).getroot()
+        for _, el in ET.iterparse(path, events=("end",), tag=tag, recover=True, huge_tree=True):
+            yield el
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    else:  # pragma: no cover
+        for _, el in ET.iterparse(path, events=("end",)):
+            if el.tag == tag:
+                yield el
+            el.clear()
+
+
+def _to_float_array(strs: List[str]) -> np.ndarray:
+    """Convert attribute strings to float64 in one C-level batch.
+
+    Falls back to per-element parsing (bad entries become NaN) only if
+    the batch conversion hits an unparsable string.
+    """
+    try:
+        return np.array(strs, dtype=np.float64)
+    except ValueError:
+        out = np.empty(len(strs), dtype=np.float64)
+        for i, s in enumerate(strs):
+            try:
+                out[i] = float(s)
+            except ValueError:
+                out[i] = np.nan
+        return out
 
 
-def parse_stop_delays(path: str) -> Dict[str, List[float]]:
-    delays: Dict[str, List[float]] = defaultdict(list)
+@functools.lru_cache(maxsize=32)
+def parse_stop_delays(path: str) -> Dict[str, np.ndarray]:
+    """Return sorted per-stop delay arrays keyed by stop id.
+
+    Results are cached per path (callers pass absolute paths) so a file
+    referenced more than once is read and parsed only once.
+    """
+    stops: List[str] = []
+    delay_strs: List[str] = []
     try:
-        root = _parse_root(path)
+        for el in _iter_elements(path, "stopinfo"):
+            stop_id = el.attrib.get("busStop") or el.attrib.get("stop")
+            if not stop_id:
+                continue
+            stops.append(stop_id)
+            delay_strs.append(el.attrib.get("delay", "0"))
     except Exception as e:  # malformed or incomplete XML
         print(f"Warning: skipping malformed XML: {path} ({e})")
-        return delays
-    for el in root.findall(".//stopinfo"):
-        stop_id = el.attrib.get("busStop") or el.attrib.get("stop")
-        if not stop_id:
-            continue
-        try:
-            delay = float(el.attrib.get("delay", "0"))
-        except ValueError:
-            continue
-        delays[stop_id].append(delay)
-    for k in delays:
-        delays[k].sort()
-    return delays
+        return {}
+    if not stops:
+        return {}
+    vals = _to_float_array(delay_strs)
+    good = np.isfinite(vals)
+    stops_arr = np.asarray(stops, dtype=object)[good]
+    vals = vals[good]
+    # Bucket delays per stop without per-row dict appends: group rows by
+    # stop via the unique inverse index and split the value array once.
+    keys, inv = np.unique(stops_arr, return_inverse=True)
+    order = np.argsort(inv, kind="stable")
+    bounds = np.cumsum(np.bincount(inv))[:-1]
+    return {k: np.sort(c) for k, c in zip(keys, np.split(vals[order], bounds))}
+
+
+def _write_frame(writer, sheet_name: str, df: pd.DataFrame) -> None:
+    """Write a DataFrame through xlsxwriter directly, one row at a time.
+
+    constant_memory mode requires strictly row-ordered writes, which
+    DataFrame.to_excel does not guarantee (it emits cells column-wise),
+    so the rows are streamed here instead.
+    """
+    ws = writer.book.add_worksheet(sheet_name)
+    ws.write_row(0, 0, list(df.columns))
+    cols = [df[c].tolist() for c in df.columns]
+    for i, row in enumerate(zip(*cols), start=1):
+        ws.write_row(i, 0, row)
 
 
 def _generate_values() -> List[int]:
@@ -89,12 +157,39 @@ def main() -> None:
     args = ap.parse_args()
 
     simdir = os.path.abspath(args.simdir)
+
+    # Discover mixed files and group by value
+    value_to_simpaths: Dict[int, Dict[int, str]] = defaultdict(dict)
+    with os.scandir(simdir) as it:
+        for entry in it:
+            m = STOP_MIXED_RE.match(entry.name)
+            if not m:
+                continue
+            value = int(m.group(1))
+            sim = int(m.group(2))
+            value_to_simpaths[value][sim] = entry.path
+
+    # Fixed value set as requested
+    values = _generate_values()
+
+    # Parse all files up front across CPU cores; parsing dominates runtime
+    # and the files are independent, so processes give near-linear speedup.
+    # Workers receive only a path and return that file's arrays once, so
+    # no baseline state needs to be shared with or re-sent to the pool.
+    baseline_paths = {sim: _find_baseline_path(simdir, sim) for sim in range(1, args.sims + 1)}
+    all_paths = sorted(
+        {p for p in baseline_paths.values() if p}
+        | {p for sims in value_to_simpaths.values() for p in sims.values()}
+    )
+    with ProcessPoolExecutor() as ex:
+        parsed = dict(zip(all_paths, ex.map(parse_stop_delays, all_paths, chunksize=4)))
+
     # Load baselines per sim index with fallback
-    baselines: Dict[int, Dict[str, List[float]]] = {}
+    baselines: Dict[int, Dict[str, np.ndarray]] = {}
     for sim in range(1, args.sims + 1):
-        p = _find_baseline_path(simdir, sim)
+        p = baseline_paths[sim]
         if p:
-            b = parse_stop_delays(p)
+            b = parsed[p]
             if b:
                 baselines[sim] = b
             else:
@@ -102,77 +197,53 @@ def main() -> None:
         else:
             print(f"Warning: missing baseline file for sim {sim} (looked for stop_events_baseline_{sim}.xml and stop_events_0_{sim}.xml)")
 
-    # Discover mixed files and group by value
-    value_to_simpaths: Dict[int, Dict[int, str]] = defaultdict(dict)
-    for name in os.listdir(simdir):
-        m = STOP_MIXED_RE.match(name)
-        if not m:
-            continue
-        value = int(m.group(1))
-        sim = int(m.group(2))
-        value_to_simpaths[value][sim] = os.path.join(simdir, name)
-
-    # Fixed value set as requested
-    values = _generate_values()
-
     summaries = []
-    with pd.ExcelWriter(args.out, engine="openpyxl") as writer:
+    # constant_memory streams each row to disk as it is written and uses
+    # inline strings, skipping the shared-strings table these mostly
+    # numeric sheets would otherwise pay to hash; all sheets go through
+    # _write_frame / write_row, which satisfy the mode's row-order rule.
+    with pd.ExcelWriter(
+        args.out,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {
+            "constant_memory": True,
+            "strings_to_numbers": False,
+            "strings_to_formulas": False,
+            "strings_to_urls": False,
+        }},
+    ) as writer:
         for value in values:
-            rows = []
+            # Column-wise array accumulation (one array per stop/sim slice)
+            value_arrs: List[np.ndarray] = []
+            sim_arrs: List[np.ndarray] = []
+            stop_arrs: List[np.ndarray] = []
+            occ_arrs: List[np.ndarray] = []
+            base_arrs: List[np.ndarray] = []
+            mix_arrs: List[np.ndarray] = []
             for sim in range(1, args.sims + 1):
                 path = value_to_simpaths.get(value, {}).get(sim)
-                mixed = parse_stop_delays(path)
+                mixed = parsed.get(path, {})
                 base = baselines.get(sim)
                 if not base:
                     continue
                 # align by stop id and occurrence order
-                for stop_id, base_list in base.items():
-                    mix_list = mixed.get(stop_id)
-                    if not mix_list:
+                for stop_id, base_arr in base.items():
+                    mix_arr = mixed.get(stop_id)
+                    if mix_arr is None or len(mix_arr) == 0:
                         continue
-                    n = min(len(base_list), len(mix_list))
-                    for idx in range(n):
-                        rows.append({
-                            "value": value,
-                            "sim": sim,
-                            "stop": stop_id,
-                            "occurrence": idx + 1,
-                            "delay_baseline_s": base_list[idx],
-                            "delay_mixed_s": mix_list[idx],
-                            "delay_delta_s": mix_list[idx] - base_list[idx],
-                        })
-            # Always create the sheet (even if empty) to cover all requested values
-            df = pd.DataFrame(rows, columns=[
-                "value",
-                "sim",
-                "stop",
-                "occurrence",
-                "delay_baseline_s",
-                "delay_mixed_s",
-                "delay_delta_s",
-            ])
-            if len(df) > 0:
-                # Per-stop average delta across all sims/occurrences for this value
-                stop_means = (
-                    df.groupby("stop", as_index=False)["delay_delta_s"].mean()
-                      .rename(columns={"delay_delta_s": "stop_avg_delta_s"})
-                )
-                df = df.merge(stop_means, on="stop", how="left")
-            df.to_excel(writer, sheet_name=str(value), index=False)
-            # summary per value across sims
-            if len(df) > 0:
-                s = df["delay_delta_s"].describe(percentiles=[0.1, 0.5, 0.9]).to_dict()
-                summaries.append({
-                    "value": value,
-                    "count": int(s.get("count", 0)),
-                    "mean_delta_s": float(s.get("mean", 0.0)),
-                    "median_delta_s": float(s.get("50%", 0.0)),
-                    "p10_delta_s": float(s.get("10%", 0.0)),
-                    "p90_delta_s": float(s.get("90%", 0.0)),
-                    "min_delta_s": float(s.get("min", 0.0)),
-                    "max_delta_s": float(s.get("max", 0.0)),
-                })
-            else:
+                    n = min(len(base_arr), len(mix_arr))
+                    value_arrs.append(np.full(n, value, dtype=np.int64))
+                    sim_arrs.append(np.full(n, sim, dtype=np.int64))
+                    stop_arrs.append(np.full(n, stop_id, dtype=object))
+                    occ_arrs.append(np.arange(1, n + 1, dtype=np.int64))
+                    base_arrs.append(base_arr[:n])
+                    mix_arrs.append(mix_arr[:n])
+            # Always create the sheet (even if empty) to cover all requested
+            # values; empty ones get a header-only stub straight from the
+            # engine, skipping DataFrame construction and the pandas writer.
+            if not value_arrs:
+                ws = writer.book.add_worksheet(str(value))
+                ws.write_row(0, 0, SHEET_COLUMNS)
                 summaries.append({
                     "value": value,
                     "count": 0,
@@ -183,10 +254,46 @@ def main() -> None:
                     "min_delta_s": 0.0,
                     "max_delta_s": 0.0,
                 })
+                continue
+            base_col = np.concatenate(base_arrs)
+            mix_col = np.concatenate(mix_arrs)
+            df = pd.DataFrame({
+                "value": np.concatenate(value_arrs),
+                "sim": np.concatenate(sim_arrs),
+                "stop": np.concatenate(stop_arrs),
+                "occurrence": np.concatenate(occ_arrs),
+                "delay_baseline_s": base_col,
+                "delay_mixed_s": mix_col,
+                "delay_delta_s": mix_col - base_col,
+            })
+            # Categorical stop ids: compact storage and integer-coded
+            # group keys for the groupby below
+            df["stop"] = df["stop"].astype("category")
+            # Per-stop average delta across all sims/occurrences for this
+            # value, broadcast back in one pass (no second frame + merge)
+            df["stop_avg_delta_s"] = df.groupby("stop", observed=True)["delay_delta_s"].transform("mean")
+            _write_frame(writer, str(value), df)
+            # summary per value across sims
+            arr = df["delay_delta_s"].to_numpy()
+            p10, p50, p90 = np.percentile(arr, [10, 50, 90])
+            summaries.append({
+                "value": value,
+                "count": int(arr.size),
+                "mean_delta_s": float(arr.mean()),
+                "median_delta_s": float(p50),
+                "p10_delta_s": float(p10),
+                "p90_delta_s": float(p90),
+                "min_delta_s": float(arr.min()),
+                "max_delta_s": float(arr.max()),
+            })
+            # Sheet is flushed; release this value's frame and column arrays
+            del df, value_arrs, sim_arrs, stop_arrs, occ_arrs, base_arrs, mix_arrs
+            gc.collect()
 
         if summaries:
-            sdf = pd.DataFrame(summaries).sort_values("value")
-            sdf.to_excel(writer, sheet_name="summary", index=False)
+            # summaries are appended in ascending value order, so the
+            # frame is built and written once with no extra sort
+            _write_frame(writer, "summary", pd.DataFrame(summaries))
 
     print(f"Excel written: {args.out}")
 
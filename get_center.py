@@ -1,24 +1,39 @@
-import xml.etree.ElementTree as ET
+import numpy as np
+
+try:
+    import lxml.etree as ET  # type: ignore
+    _HAS_LXML = True
+except Exception:  # pragma: no cover
+    import xml.etree.ElementTree as ET  # type: ignore
+    _HAS_LXML = False
+
+
+def _iter_elements(path, tag):
+    """Stream elements with the given tag, freeing each one after use."""
+    if _HAS_LXML:
+        for _, el in ET.iterparse(path, events=("end",), tag=tag, recover=True, huge_tree=True):
+            yield el
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    else:  # pragma: no cover
+        for _, el in ET.iterparse(path, events=("end",)):
+            if el.tag == tag:
+                yield el
+            el.clear()
+
 
 def find_average_center(input_file):
-    tree = ET.parse(input_file)
-    root = tree.getroot()
-
-    x_sum = 0
-    y_sum = 0
-    count = 0
-
-    for edge in root.findall('edge'):
-        if 'shape' in edge.attrib:
-            shape = edge.attrib['shape'].split()
-            coords = [tuple(map(float, coord.split(','))) for coord in shape]
-            x, y = coords[0]
-            x_sum += x
-            y_sum += y
-            count += 1
-
-    avg_x = x_sum / count
-    avg_y = y_sum / count
+    # Collect the first "x,y" token per edge, then let NumPy do the
+    # float conversion and averaging in one vectorized pass.
+    tokens = []
+    for edge in _iter_elements(input_file, 'edge'):
+        shape = edge.attrib.get('shape')
+        if shape:
+            tokens.append(shape.split(None, 1)[0])
+
+    coords = np.array([t.split(',') for t in tokens], dtype=np.float64)
+    avg_x, avg_y = coords.mean(axis=0)
 
     return avg_x, avg_y
 
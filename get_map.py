@@ -1,13 +1,42 @@
-﻿#!/usr/bin/env python3
+#!/usr/bin/env python3
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 HEADERS = {"User-Agent": "sumo-automation/1.0 (contact: example@example.com)", "Accept-Language": "en"}
 
-def get_bbox(city_name: str):
+def make_session() -> requests.Session:
+    # One session for all requests: connections are pooled and reused,
+    # and urllib3 handles retries/backoff instead of a manual sleep loop.
+    session = requests.Session()
+    retry = Retry(
+        total=3,
+        backoff_factor=3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+def _fetch_mirror(session: requests.Session, url: str, query: str):
+    # Download in 1 MiB chunks so each worker releases the socket promptly
+    response = session.post(url, data={'data': query}, stream=True, timeout=180)
+    with response:
+        if response.status_code != 200:
+            return response.status_code, b""
+        content = b"".join(response.iter_content(chunk_size=1 << 20))
+    return response.status_code, content
+
+def get_bbox(session: requests.Session, city_name: str):
     url = "https://nominatim.openstreetmap.org/search"
     params = {"q": city_name, "format": "json", "limit": 1}
-    r = requests.get(url, params=params, headers=HEADERS, timeout=30)
+    r = session.get(url, params=params, timeout=30)
     r.raise_for_status()
     data = r.json()
     if not data:
@@ -26,7 +55,8 @@ def download_osm_map(city_name: str, outfile: str):
         "https://overpass.openstreetmap.ru/api/interpreter",
         "https://overpass.osm.ch/api/interpreter",
     ]
-    south, north, west, east = get_bbox(city_name)
+    session = make_session()
+    south, north, west, east = get_bbox(session, city_name)
     overpass_query = f"""
     [out:xml][timeout:180];
     (
@@ -40,24 +70,31 @@ def download_osm_map(city_name: str, outfile: str):
     """
     print(f"Downloading OSM map for {city_name} with bbox S={south}, W={west}, N={north}, E={east} ...")
 
+    # Race all mirrors concurrently and keep the first valid response.
+    # One such race per invocation keeps us within Overpass usage policy.
     last_error = None
-    for url in mirrors:
-        for attempt in range(1, 4):
+    ex = ThreadPoolExecutor(max_workers=len(mirrors))
+    try:
+        futures = {
+            ex.submit(_fetch_mirror, session, url, overpass_query): url
+            for url in mirrors
+        }
+        for fut in as_completed(futures):
+            url = futures[fut]
             try:
-                response = requests.post(url, data={'data': overpass_query}, headers=HEADERS, timeout=180)
-                if response.status_code == 200 and len(response.content) > 10000:
-                    with open(outfile, "wb") as file:
-                        file.write(response.content)
-                    print(f"Map saved as '{outfile}' via {url}")
-                    return
-                else:
-                    print(f"[{url}] attempt {attempt}: HTTP {response.status_code}, size={len(response.content)}")
+                status, content = fut.result()
             except Exception as e:
                 last_error = e
-                print(f"[{url}] attempt {attempt}: error {e}")
-            # brief backoff
-            import time
-            time.sleep(3 * attempt)
+                print(f"[{url}] error {e}")
+                continue
+            if status == 200 and len(content) > 10000:
+                with open(outfile, "wb") as file:
+                    file.write(content)
+                print(f"Map saved as '{outfile}' via {url}")
+                return
+            print(f"[{url}] HTTP {status}, size={len(content)}")
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
 
     if last_error:
         print(f"All mirrors failed, last error: {last_error}")
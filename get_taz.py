@@ -29,7 +29,8 @@ for zone_file in zone_files:
         print(f"Failed to read '{zone_file}': {e}")
         sys.exit(1)
 
-    for edge in root.findall(".//edge"):
+    # iter() streams matches without XPath compilation or list building
+    for edge in root.iter("edge"):
         edge_id = edge.get("id")
         if edge_id:
             zones[zone_id].append(edge_id)
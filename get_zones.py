@@ -1,21 +1,36 @@
 #!/usr/bin/env python3
 import sys
-import math
-import xml.etree.ElementTree as ET
 
+import numpy as np
 
-def calculate_distance(x: float, y: float, cx: float, cy: float) -> float:
-    return math.hypot(x - cx, y - cy)
+try:
+    import lxml.etree as ET  # type: ignore
+    _HAS_LXML = True
+except Exception:  # pragma: no cover
+    import xml.etree.ElementTree as ET  # type: ignore
+    _HAS_LXML = False
 
 
-def parse_edge_shapes(input_file: str, center_x: float, center_y: float):
-    tree = ET.parse(input_file)
-    root = tree.getroot()
+def _iter_elements(path: str, tag: str):
+    """Stream elements with the given tag, freeing each one after use."""
+    if _HAS_LXML:
+        for _, el in ET.iterparse(path, events=("end",), tag=tag, recover=True, huge_tree=True):
+            yield el
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    else:  # pragma: no cover
+        for _, el in ET.iterparse(path, events=("end",)):
+            if el.tag == tag:
+                yield el
+            el.clear()
+
 
-    zone1_edges, zone2_edges, zone3_edges = [], [], []
+def parse_edge_shapes(input_file: str, center_x: float, center_y: float):
+    ids, xs, ys = [], [], []
     skipped = 0
 
-    for edge in root.findall("edge"):
+    for edge in _iter_elements(input_file, "edge"):
         shape_str = edge.get("shape")
         if not shape_str:
             skipped += 1
@@ -23,28 +38,35 @@ def parse_edge_shapes(input_file: str, center_x: float, center_y: float):
 
         # Use the first coordinate of the edge shape as a proxy position
         try:
-            x, y = map(float, shape_str.split()[0].split(","))
+            x, y = map(float, shape_str.split(None, 1)[0].split(","))
         except Exception:
             skipped += 1
             continue
 
-        dist = calculate_distance(x, y, center_x, center_y)
+        ids.append(edge.attrib["id"])
+        xs.append(x)
+        ys.append(y)
+
+    # Classify all edges in one vectorized pass: distances via np.hypot,
+    # zone buckets via np.digitize against the ring boundaries.
+    ids_arr = np.asarray(ids, dtype=object)
+    dist = np.hypot(np.asarray(xs) - center_x, np.asarray(ys) - center_y)
+    bucket = np.digitize(dist, [2000.0, 5000.0], right=True)
 
-        if dist <= 2000:
-            zone1_edges.append(edge.attrib["id"])
-        elif dist <= 5000:
-            zone2_edges.append(edge.attrib["id"])
-        else:
-            zone3_edges.append(edge.attrib["id"])
+    zone1_edges = list(ids_arr[bucket == 0])
+    zone2_edges = list(ids_arr[bucket == 1])
+    zone3_edges = list(ids_arr[bucket == 2])
 
     return zone1_edges, zone2_edges, zone3_edges, skipped
 
 
 def save_edges_to_xml(edge_ids, filename):
-    root = ET.Element("edges")
-    for eid in edge_ids:
-        ET.SubElement(root, "edge", id=eid)
-    ET.ElementTree(root).write(filename, encoding="utf-8", xml_declaration=True)
+    # Write the XML text directly instead of building an ElementTree;
+    # SUMO edge ids need no escaping, so one element per id is safe.
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<edges>\n')
+        f.writelines(f'  <edge id="{eid}"/>\n' for eid in edge_ids)
+        f.write('</edges>\n')
 
 
 if __name__ == "__main__":
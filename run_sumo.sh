@@ -47,7 +47,7 @@ PY
 ensure_python_packages() {
     local pycmd="$1"
     log_info "Ensuring required Python packages are installed..."
-    local modules=(requests numpy pandas lxml shapely rtree pyproj openpyxl)
+    local modules=(requests numpy pandas lxml shapely rtree pyproj openpyxl xlsxwriter)
     local missing=()
     for m in "${modules[@]}"; do
         if ! "$pycmd" -c "import ${m}" >/dev/null 2>&1; then